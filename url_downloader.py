@@ -3,28 +3,31 @@
 from asyncio import run as asyncio_run
 from collections.abc import Collection
 from pathlib import Path
-from typing import Type
+from typing import Optional, Type
 from sys import stdin
 from logging import DEBUG
 
-from httpx import AsyncClient
-from httpx._types import URLTypes
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
 from terminal_utils.progressor import Progressor
 from terminal_utils.log_handlers import ColoredProgressorLogHandler
 from pyutils.my_string import text_align_delimiter
 
-from url_downloader import LOG, download_urls, DownloadSummary
+from url_downloader import LOG, DEFAULT_WRITE_BUFFER_SIZE, download_urls, DownloadSummary
 from url_downloader.cli import URLDownloaderArgumentParser
+from url_downloader.hash_cache import HashCache
 
 
 async def url_downloader(
-    urls: Collection[URLTypes],
+    urls: Collection[str],
     output_directory: Path,
     use_hashing: bool = False,
     num_total_timeout_seconds: int = 60,
     quiet: bool = False,
     ignore_warnings: bool = False,
-    num_concurrent: int = 5
+    num_concurrent: int = 5,
+    write_buffer_size: int = DEFAULT_WRITE_BUFFER_SIZE,
+    hash_cache_path: Optional[Path] = None,
+    max_retries: int = 3
 ) -> DownloadSummary:
     """
     Download resources over HTTP and write them to a directory.
@@ -36,6 +39,9 @@ async def url_downloader(
     :param quiet: Whether downloading progress should be printed.
     :param ignore_warnings: Whether downloading warning should be printed.
     :param num_concurrent: The number of concurrent requests for resources.
+    :param write_buffer_size: The size in bytes of the write buffer for output files.
+    :param hash_cache_path: A path of an SQLite database file in which to cache hashes of downloaded resources.
+    :param max_retries: The maximum number of times to retry a download after a transient failure.
     :return: A summary describing the status of the download job.
     """
 
@@ -48,14 +54,31 @@ async def url_downloader(
             )
             LOG.setLevel(level=DEBUG)
 
-        async with AsyncClient(timeout=float(num_total_timeout_seconds)) as http_client:
-            return await download_urls(
-                urls=urls,
-                output_directory=output_directory,
-                http_client=http_client,
-                use_hashing=use_hashing,
-                num_concurrent=num_concurrent
-            )
+        hash_cache = HashCache(path=hash_cache_path) if hash_cache_path is not None else None
+        try:
+            async with ClientSession(
+                timeout=ClientTimeout(total=float(num_total_timeout_seconds)),
+                connector=TCPConnector(
+                    limit=num_concurrent,
+                    limit_per_host=num_concurrent,
+                    ttl_dns_cache=300,
+                    enable_cleanup_closed=True,
+                    force_close=False
+                )
+            ) as http_client:
+                return await download_urls(
+                    urls=urls,
+                    output_directory=output_directory,
+                    http_client=http_client,
+                    use_hashing=use_hashing,
+                    num_concurrent=num_concurrent,
+                    write_buffer_size=write_buffer_size,
+                    hash_cache=hash_cache,
+                    max_retries=max_retries
+                )
+        finally:
+            if hash_cache is not None:
+                hash_cache.close()
 
 
 async def main():
@@ -63,16 +86,19 @@ async def main():
 
     try:
         if not args.urls and not args.urls_files:
-            args.all_urls = set(stdin.read().splitlines())
+            args.all_urls = {url for line in stdin if (url := line.strip())}
 
         download_summary = await url_downloader(
-            urls=args.all_urls,
+            urls=tuple(sorted(args.all_urls)),
             output_directory=args.output_directory,
             use_hashing=args.use_hashing,
             num_total_timeout_seconds=args.num_total_timeout_seconds,
             quiet=args.quiet,
             ignore_warnings=args.ignore_warnings,
-            num_concurrent=args.num_concurrent
+            num_concurrent=args.num_concurrent,
+            write_buffer_size=args.write_buffer_size,
+            hash_cache_path=args.hash_cache_path,
+            max_retries=args.max_retries
         )
     except KeyboardInterrupt:
         pass
@@ -89,4 +115,11 @@ async def main():
             )
 
 if __name__ == '__main__':
+    try:
+        from uvloop import install as uvloop_install
+    except ImportError:
+        pass
+    else:
+        uvloop_install()
+
     asyncio_run(main())
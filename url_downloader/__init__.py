@@ -1,25 +1,53 @@
-from asyncio import Task
+from asyncio import Queue, TaskGroup, sleep, to_thread
 from dataclasses import dataclass
-from logging import getLogger
-from pathlib import Path, PurePath
-from typing import Optional
+from functools import lru_cache
+from os import O_CREAT, O_EXCL, O_WRONLY, fdopen, link, open as os_open, scandir
+
+try:
+    from os import POSIX_FADV_DONTNEED, posix_fadvise
+except ImportError:
+    posix_fadvise = None
+from logging import DEBUG, getLogger
+from pathlib import Path
+from typing import ClassVar, Optional
 from datetime import datetime, timedelta
-from urllib.parse import urlparse
+from random import random
+from time import monotonic
 from hashlib import sha256
 from collections.abc import Collection
 
-from httpx import AsyncClient, Response, TimeoutException, HTTPStatusError
-from httpx._types import URLTypes
+from tempfile import NamedTemporaryFile
+
+from aiohttp import ClientConnectionError, ClientPayloadError, ClientResponseError, ClientSession
 from terminal_utils.log_handlers import ProgressStatus
-from pyutils.asyncio import limited_gather
 
-from url_downloader.cli import URLDownloaderArgumentParser
+from url_downloader.hash_cache import HashCache
 
 LOG = getLogger(__name__)
 
+DOWNLOAD_CHUNK_SIZE = 65536
+DEFAULT_WRITE_BUFFER_SIZE = 1048576
+PROGRESS_INTERVAL_SECONDS = 0.05
+
+
+@lru_cache(maxsize=4096)
+def _url_basename(url: str) -> str:
+    """
+    Extract the filename component of a URL's path.
+
+    :param url: The URL whose filename component to extract.
+    :return: The filename component of the URL's path, or the empty string if the URL's path has none.
+    """
+
+    url = url.partition('#')[0].partition('?')[0]
+    url = (url.partition('://')[2] or url).rstrip('/')
+
+    return url.rsplit('/', 1)[-1] if '/' in url else ''
 
-@dataclass
+
+@dataclass(slots=True)
 class DownloadSummary:
+    num_completed: int = 0
     num_downloaded: int = 0
     num_duplicates: int = 0
     num_timeout: int = 0
@@ -28,35 +56,31 @@ class DownloadSummary:
     start_time: Optional[datetime] = None
     end_time: Optional[datetime] = None
 
-    @property
-    def num_completed(self) -> int:
-        return sum((
-            self.num_downloaded,
-            self.num_timeout,
-            self.num_status_errors,
-            self.num_unexpected_error
-        ))
+    _STR_FIELDS: ClassVar[tuple[tuple[str, str], ...]] = (
+        ('Num downloads', 'num_downloaded'),
+        ('Num duplicates', 'num_duplicates'),
+        ('Num timeouts', 'num_timeout'),
+        ('Num status errors', 'num_status_errors'),
+        ('Num unknown errors', 'num_unexpected_error')
+    )
 
     @property
     def elapsed_time(self) -> Optional[timedelta]:
         return self.end_time - self.start_time if self.start_time and self.end_time else None
 
     def __str__(self) -> str:
-        return (
-            f'Num downloads: {self.num_downloaded}\n'
-            f'Num duplicates: {self.num_duplicates}\n'
-            f'Num timeouts: {self.num_timeout}\n'
-            f'Num status errors: {self.num_status_errors}\n'
-            f'Num unknown errors: {self.num_unexpected_error}'
-        )
+        return '\n'.join(f'{label}: {getattr(self, name)}' for label, name in self._STR_FIELDS)
 
 
 async def download_urls(
-    urls: Collection[URLTypes],
+    urls: Collection[str],
     output_directory: Path,
-    http_client: AsyncClient,
+    http_client: ClientSession,
     use_hashing: bool = False,
-    num_concurrent: int = 5
+    num_concurrent: int = 5,
+    write_buffer_size: int = DEFAULT_WRITE_BUFFER_SIZE,
+    hash_cache: Optional[HashCache] = None,
+    max_retries: int = 3
 ) -> DownloadSummary:
     """
     Download resources over HTTP and write them to a directory.
@@ -66,51 +90,202 @@ async def download_urls(
     :param http_client: An HTTP client with which to retrieve the resources.
     :param use_hashing: Whether to name the resources by their hash value when writing them to the output directory.
     :param num_concurrent: The number of concurrent requests for resources.
+    :param write_buffer_size: The size in bytes of the write buffer for output files.
+    :param hash_cache: A persistent cache of hashes of previously-downloaded resources, enabling re-runs to skip
+        unchanged resources via conditional requests.
+    :param max_retries: The maximum number of times to retry a download after a transient failure.
     :return: A summary describing the status of the download job.
     """
 
     download_summary = DownloadSummary()
 
-    def result_callback(response_task: Task, url: str) -> None:
-        LOG.debug(ProgressStatus(iteration=download_summary.num_completed, total=len(urls)))
+    url_to_download_path: dict[str, Path] = {}
+    existing_names = {entry.name for entry in scandir(output_directory)}
+
+    if use_hashing:
+        planned_urls = list(urls)
+    else:
+        planned_urls = []
+        for url in urls:
+            name = _url_basename(url)
+
+            if not name:
+                LOG.warning(f'Unable to derive a filename from URL: {url}')
+                download_summary.num_unexpected_error += 1
+                download_summary.num_completed += 1
+            elif name in existing_names:
+                LOG.warning(f'File already exists at download path: {output_directory / name}')
+                download_summary.num_duplicates += 1
+            else:
+                existing_names.add(name)
+                url_to_download_path[url] = output_directory / name
+                planned_urls.append(url)
+
+    async def retrieve_url(url: str) -> bool:
+        """
+        Retrieve the resource at a URL and stream it to a file in the output directory.
+
+        :param url: The URL of the resource to be retrieved.
+        :return: Whether the resource was written to the output directory.
+        """
+
+        request_headers: dict[str, str] = {}
+        conditional_download_path: Optional[Path] = None
+
+        if use_hashing and hash_cache is not None:
+            cache_entry = hash_cache.get(url=url)
+            if cache_entry is not None:
+                cached_etag, _, cached_sha256 = cache_entry
+                if cached_etag and cached_sha256 in existing_names:
+                    request_headers['If-None-Match'] = cached_etag
+                    conditional_download_path = output_directory / cached_sha256
+
+        async with http_client.get(url=url, headers=request_headers) as response:
+            if response.status == 304 and conditional_download_path is not None:
+                LOG.warning(f'File already exists at download path: {conditional_download_path}')
+                return False
 
-        try:
-            response: Response = response_task.result()
             response.raise_for_status()
-        except TimeoutException:
-            LOG.warning(f'Timed out: {url}')
-            download_summary.num_timeout += 1
-            return
-        except HTTPStatusError as e:
-            LOG.warning(e.args[0].splitlines()[0])
-            download_summary.num_status_errors += 1
-            return
-        except:
-            LOG.exception(f'Unexpected error: {url}')
-            download_summary.num_unexpected_error += 1
-            return
-
-        download_summary.num_downloaded += 1
-
-        if use_hashing:
-            download_path: Path = output_directory / Path(sha256(response.content).hexdigest())
-        else:
-            download_path: Path = output_directory / PurePath(urlparse(url=url).path).name
-
-        if download_path.exists():
-            LOG.warning(f'File already exists at download path: {download_path}')
-            download_summary.num_duplicates += 1
-        else:
-            download_path.write_bytes(response.content)
+
+            if use_hashing:
+                hasher = sha256()
+                temp_file = NamedTemporaryFile(mode='wb', buffering=write_buffer_size, dir=output_directory, delete=False)
+                try:
+                    with temp_file:
+                        async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                            hasher.update(chunk)
+                            await to_thread(temp_file.write, chunk)
+
+                        if posix_fadvise is not None:
+                            temp_file.flush()
+                            posix_fadvise(temp_file.fileno(), 0, 0, POSIX_FADV_DONTNEED)
+                except BaseException:
+                    Path(temp_file.name).unlink(missing_ok=True)
+                    raise
+
+                temp_path = Path(temp_file.name)
+                download_path: Path = output_directory / hasher.digest().hex()
+
+                if hash_cache is not None:
+                    hash_cache.put(
+                        url=url,
+                        etag=response.headers.get('ETag'),
+                        length=response.content_length,
+                        sha256_hex=download_path.name
+                    )
+
+                if download_path.name in existing_names:
+                    temp_path.unlink()
+                    LOG.warning(f'File already exists at download path: {download_path}')
+                    return False
+
+                try:
+                    link(temp_path, download_path)
+                except FileExistsError:
+                    LOG.warning(f'File already exists at download path: {download_path}')
+                    return False
+                finally:
+                    temp_path.unlink()
+
+                existing_names.add(download_path.name)
+            else:
+                download_path: Path = url_to_download_path[url]
+
+                try:
+                    fd = os_open(download_path, O_WRONLY | O_CREAT | O_EXCL, 0o644)
+                except FileExistsError:
+                    LOG.warning(f'File already exists at download path: {download_path}')
+                    return False
+
+                try:
+                    with fdopen(fd, mode='wb', buffering=write_buffer_size) as file:
+                        async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                            await to_thread(file.write, chunk)
+
+                        if posix_fadvise is not None:
+                            file.flush()
+                            posix_fadvise(file.fileno(), 0, 0, POSIX_FADV_DONTNEED)
+                except BaseException:
+                    download_path.unlink(missing_ok=True)
+                    raise
+
+        return True
+
+    async def retrieve_url_with_retries(url: str) -> bool:
+        """
+        Retrieve the resource at a URL, retrying with exponential backoff on transient failures.
+
+        :param url: The URL of the resource to be retrieved.
+        :return: Whether the resource was written to the output directory.
+        """
+
+        for attempt in range(max_retries + 1):
+            sleep_seconds: Optional[float] = None
+
+            try:
+                return await retrieve_url(url=url)
+            except (TimeoutError, ClientConnectionError, ClientPayloadError):
+                if attempt == max_retries:
+                    raise
+            except ClientResponseError as e:
+                if (e.status != 429 and e.status < 500) or attempt == max_retries:
+                    raise
+
+                retry_after = e.headers.get('Retry-After') if e.headers is not None else None
+                if retry_after is not None and retry_after.isdigit():
+                    sleep_seconds = float(retry_after)
+
+            if sleep_seconds is None:
+                sleep_seconds = min(2 ** attempt, 30) + random()
+
+            LOG.warning(f'Retrying ({attempt + 1}/{max_retries}): {url}')
+            await sleep(sleep_seconds)
+
+    num_total = download_summary.num_completed + len(planned_urls)
+
+    url_queue: Queue = Queue()
+    for url in planned_urls:
+        url_queue.put_nowait(url)
+    for _ in range(num_concurrent):
+        url_queue.put_nowait(None)
+
+    last_progress_time = 0.0
+
+    async def work() -> None:
+        nonlocal last_progress_time
+
+        while (url := await url_queue.get()) is not None:
+            try:
+                file_was_written: bool = await retrieve_url_with_retries(url=url)
+            except TimeoutError:
+                LOG.warning(f'Timed out: {url}')
+                download_summary.num_timeout += 1
+            except ClientResponseError as e:
+                LOG.warning(f'Status error: {e.status} {e.message}: {url}')
+                download_summary.num_status_errors += 1
+            except Exception:
+                LOG.exception(f'Unexpected error: {url}')
+                download_summary.num_unexpected_error += 1
+            else:
+                download_summary.num_downloaded += 1
+
+                if not file_was_written:
+                    download_summary.num_duplicates += 1
+
+            download_summary.num_completed += 1
+
+            if LOG.isEnabledFor(DEBUG):
+                num_completed = download_summary.num_completed
+                now = monotonic()
+                if now - last_progress_time >= PROGRESS_INTERVAL_SECONDS or num_completed == num_total:
+                    last_progress_time = now
+                    LOG.debug(ProgressStatus(iteration=num_completed, total=num_total))
 
     download_summary.start_time = datetime.now()
 
-    await limited_gather(
-        iteration_coroutine=http_client.get,
-        iterable=urls,
-        result_callback=result_callback,
-        num_concurrent=num_concurrent
-    )
+    async with TaskGroup() as task_group:
+        for _ in range(num_concurrent):
+            task_group.create_task(work())
 
     download_summary.end_time = datetime.now()
 
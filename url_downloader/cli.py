@@ -5,6 +5,8 @@ from io import TextIOWrapper
 
 from pyutils.argparse.typed_argument_parser import TypedArgumentParser
 
+from url_downloader import DEFAULT_WRITE_BUFFER_SIZE
+
 
 class URLDownloaderArgumentParser(TypedArgumentParser):
 
@@ -18,10 +20,15 @@ class URLDownloaderArgumentParser(TypedArgumentParser):
         ignore_warnings: bool
         quiet: bool
         output_directory: Path
+        write_buffer_size: int
+        hash_cache_path: Optional[Path]
+        max_retries: int
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
+        self.set_defaults(all_urls=set())
+
         self.add_argument(
             '-u', '--urls',
             help='URLs of resources to be downloaded.',
@@ -67,6 +74,14 @@ class URLDownloaderArgumentParser(TypedArgumentParser):
             default=60
         )
 
+        self.add_argument(
+            '--max-retries',
+            help='The maximum number of times to retry a download after a transient failure.',
+            dest='max_retries',
+            type=int,
+            default=3
+        )
+
         self.add_argument(
             '-w', '--ignore-warnings',
             help='Ignore warning messages.',
@@ -81,6 +96,22 @@ class URLDownloaderArgumentParser(TypedArgumentParser):
             action='store_true'
         )
 
+        self.add_argument(
+            '--hash-cache',
+            help='A path of an SQLite database file in which to cache hashes of downloaded resources.',
+            dest='hash_cache_path',
+            type=Path,
+            default=None
+        )
+
+        self.add_argument(
+            '--write-buffer-size',
+            help='The size in bytes of the write buffer for output files.',
+            dest='write_buffer_size',
+            type=int,
+            default=DEFAULT_WRITE_BUFFER_SIZE
+        )
+
         self.add_argument(
             '-o', '--output-dir',
             help='A path to a directory where downloaded resources are to be saved.',
@@ -98,11 +129,8 @@ class URLDownloaderArgumentParser(TypedArgumentParser):
             option_string: Optional[str] = None
         ) -> None:
 
-            all_urls: set[str] = namespace.all_urls if hasattr(namespace, 'all_urls') else set()
-            all_urls.update(urls)
-
+            namespace.all_urls.update(urls)
             setattr(namespace, self.dest, urls)
-            namespace.all_urls = all_urls
 
     class ParseUrlsFilesAction(Action):
         def __call__(
@@ -113,16 +141,12 @@ class URLDownloaderArgumentParser(TypedArgumentParser):
             option_string: Optional[str] = None
         ) -> None:
 
-            all_urls: set[str] = namespace.all_urls if hasattr(namespace, 'all_urls') else set()
-
-            all_urls.update(
-                url.strip()
-                for urls_file in urls_files
-                for url in urls_file.read().splitlines()
-            )
+            for urls_file in urls_files:
+                for line in urls_file:
+                    if url := line.strip():
+                        namespace.all_urls.add(url)
 
             setattr(namespace, self.dest, urls_files)
-            namespace.all_urls = all_urls
 
     class ParseOutputDirectoryAction(Action):
         def __call__(
@@ -0,0 +1,47 @@
+from pathlib import Path
+from sqlite3 import Connection, connect
+from typing import Optional
+
+
+class HashCache:
+    """A persistent cache of SHA-256 hashes of downloaded resources, keyed by URL."""
+
+    def __init__(self, path: Path):
+        self._connection: Connection = connect(database=path)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS cache(url TEXT PRIMARY KEY, etag TEXT, length INTEGER, sha256 TEXT)'
+        )
+        self._connection.commit()
+
+    def get(self, url: str) -> Optional[tuple[Optional[str], Optional[int], str]]:
+        """
+        Look up the cache entry of a URL.
+
+        :param url: The URL whose cache entry to look up.
+        :return: The ETag, content length, and SHA-256 hash of the resource at the URL, or `None` if not cached.
+        """
+
+        return self._connection.execute(
+            'SELECT etag, length, sha256 FROM cache WHERE url = ?',
+            (url,)
+        ).fetchone()
+
+    def put(self, url: str, etag: Optional[str], length: Optional[int], sha256_hex: str) -> None:
+        """
+        Add or replace the cache entry of a URL.
+
+        :param url: The URL whose cache entry to add or replace.
+        :param etag: The value of the `ETag` header of the response from which the resource was retrieved.
+        :param length: The content length of the resource.
+        :param sha256_hex: The hexadecimal representation of the SHA-256 hash of the resource.
+        :return: None
+        """
+
+        self._connection.execute(
+            'INSERT OR REPLACE INTO cache(url, etag, length, sha256) VALUES (?, ?, ?, ?)',
+            (url, etag, length, sha256_hex)
+        )
+        self._connection.commit()
+
+    def close(self) -> None:
+        self._connection.close()